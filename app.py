@@ -1,15 +1,11 @@
 import pandas as pd
-import plotly.express as px
-import plotly.io as pio
 import streamlit as st
+from common import csv_bytes, read_upload
 
 # --------------------------------
 # Page setup
 # --------------------------------
-st.set_page_config(page_title="Spend & Leads Dashboard", layout="wide")
-
-# Consistent professional theme
-pio.templates.default = "plotly_dark"
+st.set_page_config(page_title="Spend & Leads Dashboard", layout="wide", initial_sidebar_state="expanded")
 
 # Light UI polish (spacing + typography)
 st.markdown(
@@ -40,76 +36,130 @@ if not uploaded_file:
 # --------------------------------
 # Load & clean
 # --------------------------------
-df = pd.read_excel(uploaded_file)
-df.columns = df.columns.str.strip()
-
-# Rename columns (matches your Excel headers)
-df = df.rename(columns={
-    "Brand": "brand",
-    "Destination": "destination",
-    "Leads": "leads",
-    "Spent (GBP)": "spent_gbp",
-    "Month": "month"
-})
-
-required_cols = {"brand", "destination", "leads", "spent_gbp", "month"}
-missing = required_cols - set(df.columns)
-if missing:
-    st.error(f"Missing required columns in Excel: {', '.join(sorted(missing))}")
-    st.stop()
-
-# Types
-df["leads"] = pd.to_numeric(df["leads"], errors="coerce").fillna(0).astype(int)
-df["spent_gbp"] = pd.to_numeric(df["spent_gbp"], errors="coerce").fillna(0.0)
-
-df["month"] = df["month"].astype(str).str.strip()
-df["brand"] = df["brand"].astype(str).str.strip()
-df["destination"] = df["destination"].astype(str).str.strip()
-
 # Month order (Power BI-like)
 month_order = [
     "January","February","March","April","May","June",
     "July","August","September","October","November","December"
 ]
-df["month"] = pd.Categorical(df["month"], categories=month_order, ordered=True)
+required_cols = {"brand", "destination", "leads", "spent_gbp", "month"}
+
+# Cached on the raw upload bytes so widget reruns don't re-parse the workbook
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_df(file_bytes: bytes) -> pd.DataFrame:
+    df = read_upload(file_bytes)
+    df.columns = df.columns.str.strip()
+
+    # Rename columns (matches your Excel headers)
+    df = df.rename(columns={
+        "Brand": "brand",
+        "Destination": "destination",
+        "Leads": "leads",
+        "Spent (GBP)": "spent_gbp",
+        "Month": "month"
+    })
+
+    # Missing columns are reported by the caller
+    if required_cols - set(df.columns):
+        return df
+
+    # Types
+    df[["leads", "spent_gbp"]] = (
+        df[["leads", "spent_gbp"]]
+        .apply(pd.to_numeric, errors="coerce")
+        .fillna({"leads": 0, "spent_gbp": 0.0})
+        .astype({"leads": "int32", "spent_gbp": "float64"})
+    )
+
+    df["month"] = df["month"].astype(str).str.strip()
+    df["brand"] = df["brand"].astype(str).str.strip()
+    df["destination"] = df["destination"].astype(str).str.strip()
+
+    df["month"] = pd.Categorical(df["month"], categories=month_order, ordered=True)
+    df["brand"] = df["brand"].astype("category")
+    df["destination"] = df["destination"].astype("category")
+    return df
+
+df = load_df(uploaded_file.getvalue())
+
+missing = required_cols - set(df.columns)
+if missing:
+    st.error(f"Missing required columns in Excel: {', '.join(sorted(missing))}")
+    st.stop()
 
 # --------------------------------
 # Sidebar filters
 # --------------------------------
 st.sidebar.header("Filters")
 
-available_months = [m for m in month_order if m in df["month"].dropna().unique().tolist()]
-if not available_months:
-    available_months = sorted(df["month"].dropna().astype(str).unique().tolist())
-
-month = st.sidebar.selectbox("Month", available_months)
-d = df[df["month"] == month].copy()
+# Option lists for the cascading filters, built once per upload
+@st.cache_data(show_spinner=False, max_entries=8)
+def option_index(df: pd.DataFrame) -> dict:
+    months = [m for m in month_order if m in df["month"].dropna().unique().tolist()]
+    if not months:
+        months = sorted(df["month"].dropna().astype(str).unique().tolist())
+
+    keys = df[["month", "brand", "destination"]].drop_duplicates()
+    by_month = keys.groupby("month", observed=True, sort=False)
+    return {
+        "months": months,
+        "brands_by_month": {m: sorted(g["brand"].dropna().unique()) for m, g in by_month},
+        "dests_by_month": {m: sorted(g["destination"].dropna().unique()) for m, g in by_month},
+        "dests_by_month_brand": {
+            k: sorted(g["destination"].dropna().unique())
+            for k, g in keys.groupby(["month", "brand"], observed=True, sort=False)
+        },
+    }
+
+options = option_index(df)
+
+month = st.sidebar.selectbox("Month", options["months"])
+brand = st.sidebar.selectbox("Brand", ["All"] + options["brands_by_month"].get(month, []))
+if brand == "All":
+    dest_options = options["dests_by_month"].get(month, [])
+else:
+    dest_options = options["dests_by_month_brand"].get((month, brand), [])
+destination = st.sidebar.selectbox("Destination", ["All"] + dest_options)
 
-brand = st.sidebar.selectbox("Brand", ["All"] + sorted(d["brand"].dropna().unique()))
+# One fused mask: a single pass over the frame instead of three chained filters
+mask = df["month"].eq(month)
 if brand != "All":
-    d = d[d["brand"] == brand]
-
-destination = st.sidebar.selectbox("Destination", ["All"] + sorted(d["destination"].dropna().unique()))
+    mask &= df["brand"].eq(brand)
 if destination != "All":
-    d = d[d["destination"] == destination]
+    mask &= df["destination"].eq(destination)
+d = df.loc[mask]
 
 # --------------------------------
 # Download filtered data
 # --------------------------------
 st.download_button(
     "Download filtered data (CSV)",
-    d.to_csv(index=False).encode("utf-8"),
+    csv_bytes(d),
     file_name=f"filtered_{month}_{brand}_{destination}.csv".replace(" ", "_"),
     mime="text/csv"
 )
 
 st.divider()
 
+# --------------------------------
+# Render cache (skip identical recomputation)
+# --------------------------------
+# Content signature of the filtered data: widget ticks that leave it unchanged
+# reuse the aggregates and figures built on a previous rerun
+sig = int(pd.util.hash_pandas_object(d, index=False).sum())
+
+def session_cached(name, key, build):
+    cached = st.session_state.get(name)
+    if cached is None or cached[0] != key:
+        cached = (key, build())
+        st.session_state[name] = cached
+    return cached[1]
+
 # --------------------------------
 # KPI cards
 # --------------------------------
-total_spend = float(d["spent_gbp"].sum())
-total_leads = int(d["leads"].sum())
+totals = d[["spent_gbp", "leads"]].sum()
+total_spend = float(totals["spent_gbp"])
+total_leads = int(totals["leads"])
 
 k1, k2, k3, k4 = st.columns(4)
 k1.metric("Total Spend", f"£{total_spend:,.2f}")
@@ -126,19 +176,23 @@ st.subheader("Top Brands")
 
 r1, r2 = st.columns(2)
 
-top3_spend = (
-    d.groupby("brand", as_index=False)["spent_gbp"]
-    .sum()
-    .sort_values("spent_gbp", ascending=False)
-    .head(3)
-)
+def build_top3():
+    top3_spend = (
+        d.groupby("brand", as_index=False, observed=True, sort=False)["spent_gbp"]
+        .sum()
+        .sort_values("spent_gbp", ascending=False)
+        .head(3)
+    )
 
-top3_leads = (
-    d.groupby("brand", as_index=False)["leads"]
-    .sum()
-    .sort_values("leads", ascending=False)
-    .head(3)
-)
+    top3_leads = (
+        d.groupby("brand", as_index=False, observed=True, sort=False)["leads"]
+        .sum()
+        .sort_values("leads", ascending=False)
+        .head(3)
+    )
+    return top3_spend, top3_leads
+
+top3_spend, top3_leads = session_cached("top3", sig, build_top3)
 
 with r1:
     st.markdown("**Top 3 by Spend**")
@@ -163,37 +217,61 @@ st.divider()
 # --------------------------------
 st.subheader("Brand Performance")
 
+# Plotly is imported only once there is data to chart, so the upload screen loads fast
+import plotly.express as px
+import plotly.io as pio
+
+# Consistent professional theme
+pio.templates.default = "plotly_dark"
+
+# Lean chart payload: no toolbar, minimal hover text, and a fixed uirevision so
+# the browser keeps zoom/pan instead of fully re-laying out on each rerun
+CHART_CONFIG = {"staticPlot": False, "displayModeBar": False}
+SPEND_HOVER = "<b>%{y}</b>: £%{x:,.2f}<extra></extra>"
+LEADS_HOVER = "<b>%{y}</b>: %{x:,.0f}<extra></extra>"
+
+def lean_layout(fig, hovertemplate):
+    fig.update_layout(uirevision="constant")
+    fig.update_traces(hovertemplate=hovertemplate)
+    return fig
+
 c1, c2 = st.columns(2)
 
-spend_by_brand = (
-    d.groupby("brand", as_index=False)["spent_gbp"]
-    .sum()
-    .sort_values("spent_gbp", ascending=True)
-)
-fig_spend_brand = px.bar(
-    spend_by_brand,
-    x="spent_gbp",
-    y="brand",
-    orientation="h",
-    title="Spend by Brand"
-)
-fig_spend_brand.update_layout(xaxis_title="Spend (GBP)", yaxis_title="Brand")
-c1.plotly_chart(fig_spend_brand, use_container_width=True)
+def build_brand_charts():
+    spend_by_brand = (
+        d.groupby("brand", as_index=False, observed=True, sort=False)["spent_gbp"]
+        .sum()
+        .sort_values("spent_gbp", ascending=True)
+    )
+    fig_spend_brand = px.bar(
+        spend_by_brand,
+        x="spent_gbp",
+        y="brand",
+        orientation="h",
+        title="Spend by Brand"
+    )
+    fig_spend_brand.update_layout(xaxis_title="Spend (GBP)", yaxis_title="Brand")
+    lean_layout(fig_spend_brand, SPEND_HOVER)
 
-leads_by_brand = (
-    d.groupby("brand", as_index=False)["leads"]
-    .sum()
-    .sort_values("leads", ascending=True)
-)
-fig_leads_brand = px.bar(
-    leads_by_brand,
-    x="leads",
-    y="brand",
-    orientation="h",
-    title="Leads by Brand"
-)
-fig_leads_brand.update_layout(xaxis_title="Leads", yaxis_title="Brand")
-c2.plotly_chart(fig_leads_brand, use_container_width=True)
+    leads_by_brand = (
+        d.groupby("brand", as_index=False, observed=True, sort=False)["leads"]
+        .sum()
+        .sort_values("leads", ascending=True)
+    )
+    fig_leads_brand = px.bar(
+        leads_by_brand,
+        x="leads",
+        y="brand",
+        orientation="h",
+        title="Leads by Brand"
+    )
+    fig_leads_brand.update_layout(xaxis_title="Leads", yaxis_title="Brand")
+    lean_layout(fig_leads_brand, LEADS_HOVER)
+    return fig_spend_brand, fig_leads_brand
+
+fig_spend_brand, fig_leads_brand = session_cached("brand_charts", sig, build_brand_charts)
+c1.plotly_chart(fig_spend_brand, use_container_width=True, theme=None, config=CHART_CONFIG)
+c2.plotly_chart(fig_leads_brand, use_container_width=True, theme=None, config=CHART_CONFIG)
 
 st.divider()
 
@@ -209,29 +287,21 @@ view = st.radio(
     horizontal=True
 )
 
-if view == "Brand summary":
-    brand_summary = (
-        d.groupby("brand", as_index=False)
-        .agg(spent_gbp=("spent_gbp", "sum"), leads=("leads", "sum"))
-        .sort_values("spent_gbp", ascending=False)
-    )
-    st.dataframe(brand_summary, use_container_width=True)
-
-elif view == "Destination summary":
-    dest_summary = (
-        d.groupby("destination", as_index=False)
+def build_breakdown():
+    if view == "Brand summary":
+        keys = "brand"
+    elif view == "Destination summary":
+        keys = "destination"
+    else:
+        keys = ["brand", "destination"]
+    return (
+        d.groupby(keys, as_index=False, observed=True, sort=False)
         .agg(spent_gbp=("spent_gbp", "sum"), leads=("leads", "sum"))
         .sort_values("spent_gbp", ascending=False)
     )
-    st.dataframe(dest_summary, use_container_width=True)
 
-else:
-    detail = (
-        d.groupby(["brand", "destination"], as_index=False)
-        .agg(spent_gbp=("spent_gbp", "sum"), leads=("leads", "sum"))
-        .sort_values("spent_gbp", ascending=False)
-    )
-    st.dataframe(detail, use_container_width=True)
+breakdown = session_cached("breakdown", (sig, view), build_breakdown)
+st.dataframe(breakdown, use_container_width=True)
 
 st.divider()
 
@@ -242,34 +312,40 @@ st.subheader("Top Destinations")
 
 top_n = st.slider("Number of destinations to show", 5, 30, 10)
 
-top_dest = (
-    d.groupby("destination", as_index=False)
-    .agg(spent_gbp=("spent_gbp", "sum"), leads=("leads", "sum"))
-    .sort_values("spent_gbp", ascending=False)
-    .head(top_n)
-)
+def build_dest_charts():
+    top_dest = (
+        d.groupby("destination", as_index=False, observed=True, sort=False)
+        .agg(spent_gbp=("spent_gbp", "sum"), leads=("leads", "sum"))
+        .sort_values("spent_gbp", ascending=False)
+        .head(top_n)
+    )
 
-colA, colB = st.columns(2)
+    fig_dest_spend = px.bar(
+        top_dest.sort_values("spent_gbp"),
+        x="spent_gbp",
+        y="destination",
+        orientation="h",
+        title="Top Destinations by Spend"
+    )
+    fig_dest_spend.update_layout(xaxis_title="Spend (GBP)", yaxis_title="Destination")
+    lean_layout(fig_dest_spend, SPEND_HOVER)
+
+    fig_dest_leads = px.bar(
+        top_dest.sort_values("leads"),
+        x="leads",
+        y="destination",
+        orientation="h",
+        title="Top Destinations by Leads"
+    )
+    fig_dest_leads.update_layout(xaxis_title="Leads", yaxis_title="Destination")
+    lean_layout(fig_dest_leads, LEADS_HOVER)
+    return fig_dest_spend, fig_dest_leads
 
-fig_dest_spend = px.bar(
-    top_dest.sort_values("spent_gbp"),
-    x="spent_gbp",
-    y="destination",
-    orientation="h",
-    title="Top Destinations by Spend"
-)
-fig_dest_spend.update_layout(xaxis_title="Spend (GBP)", yaxis_title="Destination")
-colA.plotly_chart(fig_dest_spend, use_container_width=True)
-
-fig_dest_leads = px.bar(
-    top_dest.sort_values("leads"),
-    x="leads",
-    y="destination",
-    orientation="h",
-    title="Top Destinations by Leads"
-)
-fig_dest_leads.update_layout(xaxis_title="Leads", yaxis_title="Destination")
-colB.plotly_chart(fig_dest_leads, use_container_width=True)
+fig_dest_spend, fig_dest_leads = session_cached("dest_charts", (sig, top_n), build_dest_charts)
+
+colA, colB = st.columns(2)
+colA.plotly_chart(fig_dest_spend, use_container_width=True, theme=None, config=CHART_CONFIG)
+colB.plotly_chart(fig_dest_leads, use_container_width=True, theme=None, config=CHART_CONFIG)
 
 # --------------------------------
 # Detail table at the bottom (optional but useful)
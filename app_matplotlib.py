@@ -2,10 +2,10 @@ import io
 import math
 import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
+from common import csv_bytes, read_upload
+
+# matplotlib, reportlab and numba are imported where used, so the upload screen
+# appears without paying for them
 
 # -----------------------------
 # Page setup + small CSS polish
@@ -47,7 +47,7 @@ TEMPLATE_COLUMNS = [
 ]
 def template_csv_bytes() -> bytes:
     temp = pd.DataFrame(columns=TEMPLATE_COLUMNS)
-    return temp.to_csv(index=False).encode("utf-8")
+    return csv_bytes(temp)
 
 # -----------------------------
 # Upload area (always visible)
@@ -72,9 +72,6 @@ if not uploaded_file:
 # -----------------------------
 # Load & standardize columns
 # -----------------------------
-df = pd.read_excel(uploaded_file)
-df.columns = df.columns.astype(str).str.strip()
-
 # Accept flexible headers but output consistent internal names
 rename_map = {
     "Month": "month",
@@ -90,57 +87,112 @@ rename_map = {
     "Converted Leads": "converted_leads",
     "Converted": "converted_leads",
 }
-df = df.rename(columns={c: rename_map.get(c, c) for c in df.columns})
-
 required_cols = {"month", "brand", "destination", "spent_gbp", "leads"}
+
+month_order = [
+    "January","February","March","April","May","June",
+    "July","August","September","October","November","December"
+]
+
+# Numeric columns with their fill values and dtypes; lead/message counts fit in
+# int32, impressions can pass 2**31 so they stay int64
+numeric_defaults = {"spent_gbp": 0.0, "leads": 0, "messages": 0, "impressions": 0, "converted_leads": 0}
+numeric_dtypes = {
+    "spent_gbp": "float64",
+    "leads": "int32",
+    "messages": "int32",
+    "impressions": "int64",
+    "converted_leads": "int32",
+}
+
+def coerce_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    # One batched coercion instead of a to_numeric/fillna/astype chain per column
+    cols = list(numeric_defaults)
+    df[cols] = df[cols].apply(pd.to_numeric, errors="coerce").fillna(numeric_defaults).astype(numeric_dtypes)
+    return df
+
+# Cached on the raw upload bytes so widget reruns don't re-parse the workbook
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_df(file_bytes: bytes) -> pd.DataFrame:
+    df = read_upload(file_bytes)
+    df.columns = df.columns.astype(str).str.strip()
+    df = df.rename(columns={c: rename_map.get(c, c) for c in df.columns})
+
+    # Missing columns are reported by the caller
+    if required_cols - set(df.columns):
+        return df
+
+    # Optional columns: create if missing
+    if "messages" not in df.columns:
+        df["messages"] = 0
+    if "impressions" not in df.columns:
+        df["impressions"] = 0
+    if "converted_leads" not in df.columns:
+        df["converted_leads"] = 0
+
+    # Types
+    df["month"] = df["month"].astype(str).str.strip()
+    df["brand"] = df["brand"].astype(str).str.strip()
+    df["destination"] = df["destination"].astype(str).str.strip()
+
+    # Categorical keys: filters and groupbys compare integer codes, not strings
+    # (non-standard month labels are kept, ordered after the calendar months)
+    extra_months = sorted(set(df["month"].dropna().unique()) - set(month_order))
+    df["month"] = df["month"].astype(pd.CategoricalDtype(categories=month_order + extra_months, ordered=True))
+    df["brand"] = df["brand"].astype("category")
+    df["destination"] = df["destination"].astype("category")
+
+    return coerce_numeric(df)
+
+df = load_df(uploaded_file.getvalue())
+
 missing = required_cols - set(df.columns)
 if missing:
     st.error(f"Missing required columns in Excel: {', '.join(sorted(missing))}")
     st.stop()
 
-# Optional columns: create if missing
-if "messages" not in df.columns:
-    df["messages"] = 0
-if "impressions" not in df.columns:
-    df["impressions"] = 0
-if "converted_leads" not in df.columns:
-    df["converted_leads"] = 0
-
-# Types
-df["month"] = df["month"].astype(str).str.strip()
-df["brand"] = df["brand"].astype(str).str.strip()
-df["destination"] = df["destination"].astype(str).str.strip()
-
-df["spent_gbp"] = pd.to_numeric(df["spent_gbp"], errors="coerce").fillna(0.0)
-df["leads"] = pd.to_numeric(df["leads"], errors="coerce").fillna(0).astype(int)
-df["messages"] = pd.to_numeric(df["messages"], errors="coerce").fillna(0).astype(int)
-df["impressions"] = pd.to_numeric(df["impressions"], errors="coerce").fillna(0).astype(int)
-df["converted_leads"] = pd.to_numeric(df["converted_leads"], errors="coerce").fillna(0).astype(int)
-
 # -----------------------------
 # Sidebar filters
 # -----------------------------
 st.sidebar.header("Filters")
 
-month_order = [
-    "January","February","March","April","May","June",
-    "July","August","September","October","November","December"
-]
-# Keep user's months list stable even if not full month names
-available_months = [m for m in month_order if m in df["month"].unique().tolist()]
-if not available_months:
-    available_months = sorted(df["month"].dropna().unique().tolist())
-
-month = st.sidebar.selectbox("Month", available_months)
-d = df[df["month"] == month].copy()
-
-brand = st.sidebar.selectbox("Brand", ["All"] + sorted(d["brand"].dropna().unique()))
+# Option lists for the cascading filters, built once per upload
+@st.cache_data(show_spinner=False, max_entries=8)
+def option_index(df: pd.DataFrame) -> dict:
+    # Keep user's months list stable even if not full month names
+    months = [m for m in month_order if m in df["month"].dropna().unique().tolist()]
+    if not months:
+        months = sorted(df["month"].dropna().unique().tolist())
+
+    keys = df[["month", "brand", "destination"]].drop_duplicates()
+    by_month = keys.groupby("month", observed=True, sort=False)
+    return {
+        "months": months,
+        "brands_by_month": {m: sorted(g["brand"].dropna().unique()) for m, g in by_month},
+        "dests_by_month": {m: sorted(g["destination"].dropna().unique()) for m, g in by_month},
+        "dests_by_month_brand": {
+            k: sorted(g["destination"].dropna().unique())
+            for k, g in keys.groupby(["month", "brand"], observed=True, sort=False)
+        },
+    }
+
+options = option_index(df)
+
+month = st.sidebar.selectbox("Month", options["months"])
+brand = st.sidebar.selectbox("Brand", ["All"] + options["brands_by_month"].get(month, []))
+if brand == "All":
+    dest_options = options["dests_by_month"].get(month, [])
+else:
+    dest_options = options["dests_by_month_brand"].get((month, brand), [])
+destination = st.sidebar.selectbox("Destination", ["All"] + dest_options)
+
+# One fused mask: a single pass over the frame instead of three chained filters
+mask = df["month"].eq(month)
 if brand != "All":
-    d = d[d["brand"] == brand]
-
-destination = st.sidebar.selectbox("Destination", ["All"] + sorted(d["destination"].dropna().unique()))
+    mask &= df["brand"].eq(brand)
 if destination != "All":
-    d = d[d["destination"] == destination]
+    mask &= df["destination"].eq(destination)
+d = df.loc[mask]
 
 # -----------------------------
 # Editable data (manual input)
@@ -151,7 +203,9 @@ st.subheader("Data Entry (Editable)")
 st.caption("You can manually edit Messages / Impressions / Converted Leads here. Formulas will update automatically.")
 
 editable_cols = ["month", "brand", "destination", "spent_gbp", "leads", "messages", "impressions", "converted_leads"]
-d_edit = d[editable_cols].copy()
+# Plain strings in the editor so added rows can take new brands/destinations
+# (categorical columns would be limited to existing categories)
+d_edit = d[editable_cols].astype({"month": str, "brand": str, "destination": str})
 
 edited = st.data_editor(
     d_edit,
@@ -169,11 +223,7 @@ edited = st.data_editor(
 )
 
 # Clean edited values (in case)
-edited["spent_gbp"] = pd.to_numeric(edited["spent_gbp"], errors="coerce").fillna(0.0)
-edited["leads"] = pd.to_numeric(edited["leads"], errors="coerce").fillna(0).astype(int)
-edited["messages"] = pd.to_numeric(edited["messages"], errors="coerce").fillna(0).astype(int)
-edited["impressions"] = pd.to_numeric(edited["impressions"], errors="coerce").fillna(0).astype(int)
-edited["converted_leads"] = pd.to_numeric(edited["converted_leads"], errors="coerce").fillna(0).astype(int)
+edited = coerce_numeric(edited)
 
 # -----------------------------
 # Derived metrics (formulas)
@@ -181,15 +231,57 @@ edited["converted_leads"] = pd.to_numeric(edited["converted_leads"], errors="coe
 def safe_div(n, d):
     return (n / d) if d not in (0, None) else 0.0
 
-edited["cpl"] = edited.apply(lambda r: safe_div(r["spent_gbp"], r["leads"]), axis=1)
-edited["conversion_rate"] = edited.apply(lambda r: safe_div(r["converted_leads"], r["leads"]), axis=1)
+# NumPy for typical sizes, a Numba kernel for very large frames
+from metrics import cpl_and_rate
+
+edited["cpl"], edited["conversion_rate"] = cpl_and_rate(edited)
+
+# -----------------------------
+# Aggregates (cached per edited data)
+# -----------------------------
+# Keyed on a content hash of `edited`; the frame itself is passed unhashed
+@st.cache_data(show_spinner=False, max_entries=64)
+def compute_aggregates(edited_hash: int, _edited: pd.DataFrame) -> dict:
+    # Company-wise (Brand)
+    by_brand = _edited.groupby("brand", as_index=False, observed=True, sort=False).agg(
+        spent_gbp=("spent_gbp", "sum"),
+        leads=("leads", "sum"),
+        converted_leads=("converted_leads", "sum"),
+        impressions=("impressions", "sum")
+    )
+    by_brand["cpl"], by_brand["conversion_rate"] = cpl_and_rate(by_brand)
+
+    # Destination-wise
+    by_dest = _edited.groupby("destination", as_index=False, observed=True, sort=False).agg(
+        spent_gbp=("spent_gbp", "sum"),
+        leads=("leads", "sum"),
+        converted_leads=("converted_leads", "sum"),
+        impressions=("impressions", "sum")
+    )
+    by_dest["cpl"], by_dest["conversion_rate"] = cpl_and_rate(by_dest)
+
+    # PDF inputs are slices of the same aggregates
+    top_brands_pdf = by_brand[["brand", "spent_gbp"]].sort_values("spent_gbp", ascending=False).head(5)
+    chart_df = by_dest[["destination", "leads"]].sort_values("leads", ascending=False).head(10)
+
+    return {
+        "by_brand": by_brand,
+        "by_dest": by_dest,
+        "top_brands_pdf": top_brands_pdf,
+        "chart_df": chart_df,
+    }
+
+edited_hash = int(pd.util.hash_pandas_object(edited).sum())
+aggs = compute_aggregates(edited_hash, edited)
 
 # KPIs from edited data (not original)
-total_spend = float(edited["spent_gbp"].sum())
-total_leads = int(edited["leads"].sum())
-total_messages = int(edited["messages"].sum())
-total_impressions = int(edited["impressions"].sum())
-total_converted = int(edited["converted_leads"].sum())
+# One column-wise reduction over all numeric columns
+totals = edited[list(numeric_defaults)].sum()
+total_spend = float(totals["spent_gbp"])
+total_leads = int(totals["leads"])
+total_messages = int(totals["messages"])
+total_impressions = int(totals["impressions"])
+total_converted = int(totals["converted_leads"])
 
 overall_cpl = safe_div(total_spend, total_leads)
 overall_cr = safe_div(total_converted, total_leads)
@@ -213,7 +305,7 @@ st.markdown("[⬆️ Go to Upload area](#upload)")
 # Download edited data
 st.download_button(
     "Download edited data (CSV)",
-    data=edited.to_csv(index=False).encode("utf-8"),
+    data=csv_bytes(edited),
     file_name=f"edited_{month}_{brand}_{destination}.csv".replace(" ", "_"),
     mime="text/csv"
 )
@@ -224,7 +316,8 @@ st.divider()
 # Charts helpers (Matplotlib)
 # -----------------------------
 def barh_chart(df_plot, label_col, value_col, title, xlabel):
-    df_plot = df_plot.copy()
+    import matplotlib.pyplot as plt
+
     df_plot = df_plot.sort_values(value_col, ascending=True)
 
     fig, ax = plt.subplots(figsize=(8, 4.8))
@@ -233,9 +326,29 @@ def barh_chart(df_plot, label_col, value_col, title, xlabel):
     ax.set_xlabel(xlabel)
     ax.set_ylabel("")
     ax.grid(axis="x", linestyle="--", alpha=0.3)
-    fig.tight_layout()
+    # Fixed margins instead of tight_layout's iterative text-extent solver
+    fig.subplots_adjust(left=0.25, right=0.98, top=0.92, bottom=0.12)
     return fig
 
+def fig_to_png_bytes(fig, dpi=200) -> bytes:
+    import matplotlib.pyplot as plt
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+# Charts rendered to PNG once per distinct (label, value) data, for both the
+# screen and the PDF; each call builds and closes its own Figure, so nothing
+# mutable is shared across sessions
+@st.cache_data(show_spinner=False, max_entries=32)
+def barh_png(records: tuple, title, xlabel, dpi=200) -> bytes:
+    df_plot = pd.DataFrame(list(records), columns=["label", "value"])
+    return fig_to_png_bytes(barh_chart(df_plot, "label", "value", title, xlabel), dpi=dpi)
+
+def barh_records(df_plot, label_col, value_col) -> tuple:
+    return tuple(zip(df_plot[label_col].astype(str), df_plot[value_col].tolist()))
+
 # -----------------------------
 # Two dashboards: Leads + Messages placeholder
 # -----------------------------
@@ -245,50 +358,37 @@ with tab_leads:
     st.subheader("Company-wise and Destination-wise View (Leads)")
     top_n = st.slider("Top N items", 5, 30, 10, key="topn_leads")
 
-    # Company-wise (Brand)
-    by_brand = edited.groupby("brand", as_index=False).agg(
-        spent_gbp=("spent_gbp", "sum"),
-        leads=("leads", "sum"),
-        converted_leads=("converted_leads", "sum"),
-        impressions=("impressions", "sum")
-    )
-    by_brand["cpl"] = by_brand.apply(lambda r: safe_div(r["spent_gbp"], r["leads"]), axis=1)
-    by_brand["conversion_rate"] = by_brand.apply(lambda r: safe_div(r["converted_leads"], r["leads"]), axis=1)
-
-    # Destination-wise
-    by_dest = edited.groupby("destination", as_index=False).agg(
-        spent_gbp=("spent_gbp", "sum"),
-        leads=("leads", "sum"),
-        converted_leads=("converted_leads", "sum"),
-        impressions=("impressions", "sum")
-    )
-    by_dest["cpl"] = by_dest.apply(lambda r: safe_div(r["spent_gbp"], r["leads"]), axis=1)
-    by_dest["conversion_rate"] = by_dest.apply(lambda r: safe_div(r["converted_leads"], r["leads"]), axis=1)
+    by_brand = aggs["by_brand"]
+    by_dest = aggs["by_dest"]
 
     cA, cB = st.columns(2)
 
     # Charts: Leads by brand / Leads by destination
     with cA:
         st.markdown("### Leads by Company (Brand)")
-        fig = barh_chart(by_brand.sort_values("leads", ascending=False).head(top_n), "brand", "leads", "Top Companies by Leads", "Leads")
-        st.pyplot(fig, use_container_width=True)
+        top_brands = by_brand.sort_values("leads", ascending=False).head(top_n)
+        png = barh_png(barh_records(top_brands, "brand", "leads"), "Top Companies by Leads", "Leads")
+        st.image(png, use_container_width=True)
 
     with cB:
         st.markdown("### Leads by Destination")
-        fig = barh_chart(by_dest.sort_values("leads", ascending=False).head(top_n), "destination", "leads", "Top Destinations by Leads", "Leads")
-        st.pyplot(fig, use_container_width=True)
+        top_dests = by_dest.sort_values("leads", ascending=False).head(top_n)
+        png = barh_png(barh_records(top_dests, "destination", "leads"), "Top Destinations by Leads", "Leads")
+        st.image(png, use_container_width=True)
 
     st.markdown("### Summary Tables")
     t1, t2 = st.columns(2)
 
     with t1:
-        show_brand = by_brand.sort_values("spent_gbp", ascending=False).copy()
-        show_brand["conversion_rate"] = (show_brand["conversion_rate"] * 100).round(2).astype(str) + "%"
+        show_brand = by_brand.sort_values("spent_gbp", ascending=False).assign(
+            conversion_rate=lambda x: (x["conversion_rate"] * 100).round(2).astype(str) + "%"
+        )
         st.dataframe(show_brand, use_container_width=True, hide_index=True)
 
     with t2:
-        show_dest = by_dest.sort_values("spent_gbp", ascending=False).copy()
-        show_dest["conversion_rate"] = (show_dest["conversion_rate"] * 100).round(2).astype(str) + "%"
+        show_dest = by_dest.sort_values("spent_gbp", ascending=False).assign(
+            conversion_rate=lambda x: (x["conversion_rate"] * 100).round(2).astype(str) + "%"
+        )
         st.dataframe(show_dest, use_container_width=True, hide_index=True)
 
 with tab_messages:
@@ -311,71 +411,68 @@ st.divider()
 st.subheader("Download PDF Summary Report")
 st.caption("Creates a quick one-page PDF summary of KPIs + top tables + one chart snapshot.")
 
-def fig_to_png_bytes(fig) -> bytes:
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", dpi=200, bbox_inches="tight")
-    plt.close(fig)
-    return buf.getvalue()
+# Static report layout: (x, offset from page top, text template, font, size)
+PDF_LAYOUT = (
+    (36, 40, "Spend, Leads & Messages — Summary Report", "Helvetica-Bold", 14),
+    (36, 58, "Filters: Month={month} | Brand={brand} | Destination={destination}", "Helvetica", 10),
+    # KPIs
+    (36, 90, "Key Metrics", "Helvetica-Bold", 11),
+    (36, 106, "Total Spend: £{total_spend:,.2f}", "Helvetica", 10),
+    (36, 120, "Total Leads: {total_leads:,}", "Helvetica", 10),
+    (36, 134, "Total Messages: {total_messages:,}", "Helvetica", 10),
+    (36, 148, "Impressions: {total_impressions:,}", "Helvetica", 10),
+    (36, 162, "CPL: £{overall_cpl:,.2f}", "Helvetica", 10),
+    (36, 176, "Conversion Rate: {overall_cr_pct:,.2f}%", "Helvetica", 10),
+    # Top table (Brands by spend)
+    (36, 198, "Top Companies (by Spend)", "Helvetica-Bold", 11),
+)
+PDF_TABLE_TOP = 212
 
 def build_pdf_bytes() -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
     pdf_buf = io.BytesIO()
     c = canvas.Canvas(pdf_buf, pagesize=A4)
     w, h = A4
 
-    # Title
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(36, h - 40, "Spend, Leads & Messages — Summary Report")
-
-    c.setFont("Helvetica", 10)
-    c.drawString(36, h - 58, f"Filters: Month={month} | Brand={brand} | Destination={destination}")
-
-    # KPIs
-    y = h - 90
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(36, y, "Key Metrics")
-    c.setFont("Helvetica", 10)
-    y -= 16
-    c.drawString(36, y, f"Total Spend: £{total_spend:,.2f}")
-    y -= 14
-    c.drawString(36, y, f"Total Leads: {total_leads:,}")
-    y -= 14
-    c.drawString(36, y, f"Total Messages: {total_messages:,}")
-    y -= 14
-    c.drawString(36, y, f"Impressions: {total_impressions:,}")
-    y -= 14
-    c.drawString(36, y, f"CPL: £{overall_cpl:,.2f}")
-    y -= 14
-    c.drawString(36, y, f"Conversion Rate: {overall_cr*100:,.2f}%")
-
-    # Top table (Brands by spend)
-    y -= 22
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(36, y, "Top Companies (by Spend)")
-    y -= 14
+    values = {
+        "month": month,
+        "brand": brand,
+        "destination": destination,
+        "total_spend": total_spend,
+        "total_leads": total_leads,
+        "total_messages": total_messages,
+        "total_impressions": total_impressions,
+        "overall_cpl": overall_cpl,
+        "overall_cr_pct": overall_cr * 100,
+    }
+    font = None
+    for x, dy, text, font_name, size in PDF_LAYOUT:
+        if font != (font_name, size):
+            font = (font_name, size)
+            c.setFont(font_name, size)
+        c.drawString(x, h - dy, text.format(**values))
+
+    y = h - PDF_TABLE_TOP
     c.setFont("Helvetica", 9)
 
-    top_brands_pdf = (
-        edited.groupby("brand", as_index=False)["spent_gbp"]
-        .sum()
-        .sort_values("spent_gbp", ascending=False)
-        .head(5)
-    )
+    top_brands_pdf = aggs["top_brands_pdf"]
 
-    for _, r in top_brands_pdf.iterrows():
-        c.drawString(36, y, f"{r['brand']}: £{float(r['spent_gbp']):,.2f}")
+    lines = [
+        f"{b}: £{float(v):,.2f}"
+        for b, v in zip(top_brands_pdf["brand"].to_numpy(), top_brands_pdf["spent_gbp"].to_numpy())
+    ]
+    for line in lines:
+        c.drawString(36, y, line)
         y -= 12
 
-    # Add one chart image (Leads by destination top 10)
+    # Add one chart image (Leads by destination top 10); with the default Top N
+    # this is the same cached render as the on-screen destinations chart
     y -= 12
-    chart_df = (
-        edited.groupby("destination", as_index=False)["leads"]
-        .sum()
-        .sort_values("leads", ascending=False)
-        .head(10)
-    )
-    fig = barh_chart(chart_df, "destination", "leads", "Top Destinations by Leads", "Leads")
-    img_bytes = fig_to_png_bytes(fig)
-    img = ImageReader(io.BytesIO(img_bytes))
+    chart_png = barh_png(barh_records(aggs["chart_df"], "destination", "leads"), "Top Destinations by Leads", "Leads")
+    img = ImageReader(io.BytesIO(chart_png))
 
     # place image
     img_w = w - 72
@@ -386,11 +483,16 @@ def build_pdf_bytes() -> bytes:
     c.save()
     return pdf_buf.getvalue()
 
-pdf_bytes = build_pdf_bytes()
+# Build the report only on request; a stored PDF is offered while filters and data are unchanged
+pdf_key = (month, brand, destination, edited_hash)
+if st.button("Generate PDF"):
+    st.session_state["pdf"] = (pdf_key, build_pdf_bytes())
 
-st.download_button(
-    "Download PDF Report",
-    data=pdf_bytes,
-    file_name=f"summary_report_{month}.pdf".replace(" ", "_"),
-    mime="application/pdf"
-)
+pdf = st.session_state.get("pdf")
+if pdf is not None and pdf[0] == pdf_key:
+    st.download_button(
+        "Download PDF Report",
+        data=pdf[1],
+        file_name=f"summary_report_{month}.pdf".replace(" ", "_"),
+        mime="application/pdf"
+    )
@@ -0,0 +1,100 @@
+"""Helpers shared by app.py and app_matplotlib.py."""
+
+import hashlib
+import io
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from pathlib import Path
+
+# Filtered frames share memory with their source until written to
+# (always on from pandas 3, where setting the option warns)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+# -----------------------------
+# Upload cache (raw sheets as Parquet)
+# -----------------------------
+# Raw sheets are kept on disk as Parquet, keyed by the upload's content hash and
+# shared by both dashboards: re-uploading a workbook, opening it in the other app
+# or restarting the server skips the Excel parse. Each app still runs its own
+# (cheap) cleaning on top, so changes to that code never see stale data.
+# Uploads hold customers' spend data, so the cache lives in the user's own cache
+# directory, is owner-only, and entries expire after a day.
+UPLOAD_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "spend-leads-dashboard" / "uploads"
+UPLOAD_CACHE_MAX_FILES = 32
+UPLOAD_CACHE_MAX_AGE_S = 24 * 60 * 60
+
+def upload_cache_dir() -> Path | None:
+    # The cache directory if it is private to this user, else None (cache off)
+    try:
+        UPLOAD_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        info = UPLOAD_CACHE_DIR.stat()
+        if hasattr(os, "getuid"):
+            if info.st_uid != os.getuid():
+                return None
+            if info.st_mode & 0o077:
+                UPLOAD_CACHE_DIR.chmod(0o700)
+    except OSError:
+        return None
+    return UPLOAD_CACHE_DIR
+
+def prune_upload_cache(cache_dir: Path) -> None:
+    # Drop entries (and stray temp files) past the age cap, then the least
+    # recently used entries past the count cap
+    try:
+        cutoff = time.time() - UPLOAD_CACHE_MAX_AGE_S
+        for f in cache_dir.glob("*.tmp"):
+            if f.stat().st_mtime < cutoff:
+                f.unlink(missing_ok=True)
+        files = sorted(cache_dir.glob("*.parquet"), key=lambda f: f.stat().st_mtime, reverse=True)
+        for i, f in enumerate(files):
+            if i >= UPLOAD_CACHE_MAX_FILES or f.stat().st_mtime < cutoff:
+                f.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+def read_upload(file_bytes: bytes) -> pd.DataFrame:
+    cache_dir = upload_cache_dir()
+    if cache_dir is None:
+        return pd.read_excel(io.BytesIO(file_bytes), engine="calamine")
+
+    path = cache_dir / f"{hashlib.sha256(file_bytes).hexdigest()}.parquet"
+    try:
+        df = pd.read_parquet(path)
+        path.touch()
+        return df
+    except (OSError, pa.ArrowException, ValueError):
+        pass
+
+    df = pd.read_excel(io.BytesIO(file_bytes), engine="calamine")
+
+    # Best effort: sheets Arrow can't store (e.g. a column mixing numbers and
+    # text) or an unwritable disk just aren't cached
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp, compression="zstd", engine="pyarrow")
+        tmp.chmod(0o600)
+        tmp.replace(path)
+    except (OSError, pa.ArrowException, ValueError, TypeError):
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
+    prune_upload_cache(cache_dir)
+    return df
+
+# -----------------------------
+# CSV export
+# -----------------------------
+def csv_bytes(df: pd.DataFrame) -> bytes:
+    # Arrow's CSV writer emits UTF-8 bytes directly (no intermediate Python str);
+    # columns Arrow can't type (e.g. mixed numbers and text) go through to_csv
+    try:
+        buf = io.BytesIO()
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+        return buf.getvalue()
+    except (pa.ArrowException, TypeError, ValueError):
+        return df.to_csv(index=False).encode("utf-8")
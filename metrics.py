@@ -0,0 +1,48 @@
+"""CPL and conversion-rate columns for app_matplotlib.py."""
+
+import functools
+import numpy as np
+
+# Below this many rows the NumPy path is about as fast, so small frames never
+# pay numba's one-off import/compile cost
+NUMBA_MIN_ROWS = 100_000
+
+def safe_div_cols(n, d):
+    # Column-wise safe_div: one NumPy pass instead of a Python call per row
+    n = n.to_numpy(dtype="float64")
+    d = d.to_numpy(dtype="float64")
+    return np.divide(n, d, out=np.zeros(len(d)), where=d != 0)
+
+def cpl_cr_loop(spent, leads, converted):
+    out_cpl = np.empty_like(spent)
+    out_cr = np.empty_like(spent)
+    for i in range(spent.size):
+        l = leads[i]
+        out_cpl[i] = spent[i] / l if l else 0.0
+        out_cr[i] = converted[i] / l if l else 0.0
+    return out_cpl, out_cr
+
+@functools.lru_cache(maxsize=1)
+def cpl_cr_kernel():
+    # Compiled once per process (and cached on disk across restarts); defined in
+    # this module rather than the app script so Streamlit reruns reuse it.
+    # None when numba isn't installed.
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba.njit(cache=True, fastmath=True)(cpl_cr_loop)
+
+def cpl_and_rate(frame):
+    # Returns (cpl, conversion_rate) arrays for a frame with spend/leads/converted columns
+    kernel = cpl_cr_kernel() if len(frame) >= NUMBA_MIN_ROWS else None
+    if kernel is None:
+        return (
+            safe_div_cols(frame["spent_gbp"], frame["leads"]),
+            safe_div_cols(frame["converted_leads"], frame["leads"]),
+        )
+    return kernel(
+        frame["spent_gbp"].to_numpy(dtype="float64"),
+        frame["leads"].to_numpy(dtype="float64"),
+        frame["converted_leads"].to_numpy(dtype="float64"),
+    )